@@ -1,21 +1,32 @@
 #!/usr/bin/env python3
 
-import re
+import hashlib
+import inspect
 import random
 import shlex
+import shutil
 import json
+import tempfile
+import threading
+import time
+from collections import deque
+from queue import Empty, Queue
 from collections.abc import Iterator
-from os import PathLike
-from itertools import product
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from os import PathLike, cpu_count
+from itertools import count, islice
 from pathlib import Path
 from string import Template
-from subprocess import DEVNULL, run
+from subprocess import DEVNULL, PIPE, CalledProcessError, Popen, TimeoutExpired, run
 from typing import (
+    BinaryIO,
     Union,
     Callable,
     Dict,
     Generator,
     List,
+    Set,
     Tuple,
     Any,
     Optional,
@@ -34,34 +45,125 @@ FunctionDef = dict
 PathStr = PathLike[str]
 ParameterDef = Dict[str, FunctionDef]
 Parameter = Dict[str, ParameterVal]
+TemplateParts = List[Tuple[str, Optional[str]]]
 
+# Sentinel for exhausted iterators
+_EXHAUSTED = object()
 
-def files_find_ext(ext: str, files: Union[PathStr, List[Path]]) -> List[Path]:
+# Maximum number of runs whose parameters are generated at once
+PARAMS_BATCH_SIZE = 1024
+
+# orjson is used to save and load parameters if available
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Modules to look for the functions that generate parameters and sweeps
+PARAMS_MODULES: List[Any] = [random]
+SWEEPS_MODULES: List[Any] = []
+try:
+    import numpy as np
+
+    PARAMS_MODULES.append(np.random)
+    SWEEPS_MODULES.append(np)
+except ImportError:
+    pass
+
+
+def files_find_ext(ext: str, files: Union[PathStr, List[Path]]) -> Iterator[Path]:
     """List files in a directory that match a extension.
 
+    The files are generated on demand, so the directory is only
+    traversed as far as needed.
+
     Args:
         ext: Extension of the file to be found.
         dir: Directory to look for files or list of files.
 
     Returns:
-        List of files in the directory.
+        Iterator of files in the directory.
     """
     if isinstance(files, list):
-        return [f for f in files if f.suffix == r"." + ext]
+        return (f for f in files if f.suffix == r"." + ext)
     else:
-        return list(Path(files).glob(r"*." + ext))
+        return Path(files).glob(r"*." + ext)
 
 
-def files_list(dir: PathStr) -> List[Path]:
+def files_list(dir: PathStr) -> Iterator[Path]:
     """List all regular files in a directory.
 
     Args:
         dir: Directory to look for files.
 
     Returns:
-        List of files in the directory.
+        Iterator of files in the directory.
+    """
+    return (p for p in Path(dir).iterdir() if p.is_file())
+
+
+def function_resolve(
+    name: str, luts: List[Dict[str, Callable]], modules: List[Any]
+) -> Callable:
+    """Find a function by its name.
+
+    The function is looked for first in the lookup tables and then
+    in the modules, in the order given.
+
+    Args:
+        name: Name of the function.
+        luts: Dictionaries mapping names to functions.
+        modules: Modules where the function may be defined.
+
+    Raises:
+        ValueError: The function does not exist.
+
+    Returns:
+        The function found.
+    """
+    for lut in luts:
+        fn = lut.get(name, None)
+        if fn is not None:
+            return fn
+
+    for mod in modules:
+        fn = getattr(mod, name, None)
+        if fn is not None:
+            return fn
+
+    raise ValueError(f"Function {name} does not exist")
+
+
+def params_compile(
+    params_def: ParameterDef, custom_fns: Optional[Dict[str, Callable]] = None
+) -> List[Tuple[str, Callable, tuple]]:
+    """Resolve the functions used to generate a set of parameters.
+
+    The function is chosen with a list in the following order:
+    [custom_fns, random, other modules]
+
+    The result can be reused to generate as many sets of parameters
+    as needed without looking up the functions again.
+
+    Args:
+        params_def: Definition of the parameters.
+        custom_fns: Custom functions to generate the parameters.
+
+    Raises:
+        ValueError: A function does not exist.
+
+    Returns:
+        List of names, functions and arguments of the parameters.
     """
-    return [p for p in Path(dir).iterdir() if p.is_file()]
+    luts = [custom_fns] if custom_fns else []
+    return [
+        (
+            param,
+            function_resolve(info["function"], luts, PARAMS_MODULES),
+            tuple(info["values"]),
+        )
+        for param, info in params_def.items()
+    ]
 
 
 def params_generate(
@@ -74,36 +176,93 @@ def params_generate(
 
     Args:
         params_def: Definition of the parameters.
+        custom_fns: Custom functions to generate the parameters.
 
     Raises:
-        OSError: The parameters file cannot be opened.
+        ValueError: A function does not exist.
 
     Returns:
         Parameter: Names and values of the parameters.
     """
-    functions: Dict[str, Callable] = custom_fns if custom_fns else {}
-    params: Parameter = {}
+    return {
+        param: fn(*args) for param, fn, args in params_compile(params_def, custom_fns)
+    }
 
-    modules = [random]
-    try:
-        import numpy as np
 
-        modules.append(np.random)
-    except ImportError:
-        pass
+def params_generate_batch(
+    params_def: ParameterDef,
+    custom_fns: Optional[Dict[str, Callable]] = None,
+    n: int = 1,
+) -> Dict[str, List[ParameterVal]]:
+    """Generate multiple sets of random parameters at once.
+
+    The functions are chosen in the same way as in `params_generate`.
+    Functions from numpy.random that accept a `size` generate all the
+    values in a single call, the rest of the functions are called once
+    per value.
+
+    All the values of a parameter are generated before the values of the
+    next one, so the values obtained with a seed are not the same than
+    with `n` calls to `params_generate`.
+
+    Args:
+        params_def: Definition of the parameters.
+        custom_fns: Custom functions to generate the parameters.
+        n: Number of values to generate for every parameter.
+
+    Raises:
+        ValueError: A function does not exist.
+
+    Returns:
+        Names and list of values of the parameters.
+    """
+    return params_sample_batch(params_compile(params_def, custom_fns), n)
+
 
-    for param, info in params_def.items():
-        fns: List[Optional[Callable]] = []
-        fns.append(functions.get(info["function"], None))
-        fns.extend([getattr(mod, info["function"], None) for mod in modules])
+def params_sample_batch(
+    params_compiled: List[Tuple[str, Callable, tuple]], n: int
+) -> Dict[str, List[ParameterVal]]:
+    """Generate multiple values for parameters already compiled.
 
-        if not any(fns):
-            raise ValueError(f"Function {info['function']} does not exist")
+    See `params_generate_batch`.
+
+    Args:
+        params_compiled: Parameters compiled with `params_compile`.
+        n: Number of values to generate for every parameter.
+
+    Returns:
+        Names and list of values of the parameters.
+    """
+    batch: Dict[str, List[ParameterVal]] = {}
+    for param, fn, args in params_compiled:
+        if params_is_batchable(fn, args):
+            batch[param] = fn(*args, size=n).tolist()
+        else:
+            batch[param] = [fn(*args) for _ in range(n)]
+    return batch
 
-        fn = next(fn for fn in fns if fn is not None)
-        params[param] = fn(*info["values"])
 
-    return params
+def params_is_batchable(fn: Callable, args: tuple) -> bool:
+    """Check whether a function can generate many values in a single call.
+
+    Only functions from numpy.random whose `size` is not already given
+    by the arguments are batched.
+
+    Args:
+        fn: Function that generates the parameter.
+        args: Arguments of the function.
+
+    Returns:
+        Whether the function can be called with `size`.
+    """
+    owner = getattr(fn, "__self__", None)
+    if not type(owner).__module__.startswith("numpy.random"):
+        return False
+    try:
+        inspect.signature(fn).bind(*args, size=1)
+    except (TypeError, ValueError):
+        return False
+    return True
 
 
 def params_parse(params_def: PathStr) -> Optional[ParameterDef]:
@@ -120,6 +279,10 @@ def params_parse(params_def: PathStr) -> Optional[ParameterDef]:
     template files but without the $.
     The argumens are given in a list separated by spaces.
 
+    The definitions are cached, so a file is only parsed again when its
+    modification time or size change. Every call returns new dictionaries
+    and lists, which can be modified without changing the cache.
+
     Args:
         params_def: Path to the parameter definition file or the definition itself.
 
@@ -129,14 +292,57 @@ def params_parse(params_def: PathStr) -> Optional[ParameterDef]:
     Returns:
         ParameterDef: Names and values of the parameters.
     """
-    content: List[str] = []
-
     if Path(params_def).exists():
-        with open(params_def, "r+") as params_fd:
-            content = [l.strip() for l in params_fd.readlines()]
+        path = Path(params_def).resolve()
+        st = path.stat()
+        parsed = _params_parse_cached(str(path), (st.st_mtime_ns, st.st_size))
     elif isinstance(params_def, str):
-        content = params_def.split("\n")
+        parsed = _params_parse_cached(params_def, None)
+    else:
+        return {}
+    return {
+        param: {"function": function, "values": list(values)}
+        for param, function, values in parsed
+    }
+
+
+def _params_lines(params_def: str, is_file: bool) -> Iterator[str]:
+    """Generate the valid lines of a parameter definition one at a time.
+
+    Lines are stripped and empty lines and comments are skipped.
+
+    Args:
+        params_def: Path to the parameter definition file or the definition itself.
+        is_file: Whether `params_def` is a path to a file.
+
+    Returns:
+        Iterator of the valid lines.
+    """
+    if is_file:
+        with open(params_def, "r") as params_fd:
+            lines = (l.strip() for l in params_fd)
+            yield from (l for l in lines if l and not l.startswith("#"))
+    else:
+        lines = (l.strip() for l in params_def.split("\n"))
+        yield from (l for l in lines if l and not l.startswith("#"))
+
+
+@lru_cache(maxsize=32)
+def _params_parse_cached(
+    params_def: str, stat: Optional[Tuple[int, int]]
+) -> Tuple[Tuple[str, str, Tuple[ParameterVal, ...]], ...]:
+    """Parse parameter definitions. See `params_parse`.
+
+    The result is immutable, since it is shared by every call.
+
+    Args:
+        params_def: Path to the parameter definition file or the definition itself.
+        stat: Modification time and size of the file or None if
+            `params_def` is the definition itself.
 
+    Returns:
+        Names, functions and values of the parameters.
+    """
     def cast_value(value: str) -> ParameterVal:
         """Try to cast a value to different types.
         By order, the types are int, float and str.
@@ -155,21 +361,56 @@ def params_parse(params_def: PathStr) -> Optional[ParameterDef]:
             except ValueError:
                 return value
 
-    range_re = re.compile(r"^(\w+){(\d+:\d+)}.*")
-    data: Dict[str, FunctionDef] = {}
-    valid_lines = filter(lambda l: l and not l.startswith("#"), content)
-    for line in valid_lines:
+    data: Dict[str, Tuple[str, Tuple[ParameterVal, ...]]] = {}
+    for line in _params_lines(params_def, stat is not None):
         param, function, *vals = line.split(" ")
-        values = [cast_value(v) for v in vals]
+        entry = (function, tuple(cast_value(v) for v in vals))
         if "{" in param and "}" in param:
-            name, range_str = range_re.search(param).groups()
-            start, end = [int(n) for n in range_str.split(":")]
+            # The shorthand `name{start:end}` defines name{start} to name{end}
+            name, range_str = param.split("{", 1)
+            start, end = [int(n) for n in range_str.split("}", 1)[0].split(":")]
             for i in range(start, end + 1):
-                data[f"{name}{i}"] = {"function": function, "values": values}
+                data[f"{name}{i}"] = entry
         else:
-            data[param] = {"function": function, "values": values}
+            data[param] = entry
+
+    return tuple((param, *entry) for param, entry in data.items())
+
 
-    return data
+def sweeps_product(factors: List[Callable[[], Any]]) -> Iterator[tuple]:
+    """Generate the cartesian product of a list of iterables lazily.
+
+    Unlike `itertools.product`, the iterables are not stored in memory.
+    Every factor is a function without arguments that creates the
+    iterable again each time it needs to be traversed.
+
+    Args:
+        factors: Functions creating the iterables of every axis.
+
+    Returns:
+        Iterator: Tuples with one value for every axis.
+    """
+    iters = [iter(factor()) for factor in factors]
+    bundle = [next(it, _EXHAUSTED) for it in iters]
+    if not factors or any(value is _EXHAUSTED for value in bundle):
+        return
+
+    while True:
+        yield tuple(bundle)
+
+        # Advance the last axis and carry to the previous ones when exhausted
+        axis = len(factors) - 1
+        while axis >= 0:
+            value = next(iters[axis], _EXHAUSTED)
+            if value is not _EXHAUSTED:
+                bundle[axis] = value
+                break
+            iters[axis] = iter(factors[axis]())
+            bundle[axis] = next(iters[axis])
+            axis -= 1
+
+        if axis < 0:
+            return
 
 
 def sweeps_generate(
@@ -180,6 +421,9 @@ def sweeps_generate(
     The sweeps are defined in the same way the parameters are defined.
     For that, see `params_generate`.
 
+    The values of `list` and `range` are generated on demand, so big
+    sweeps are never stored in memory.
+
     Args:
         sweeps_def: Path to the sweeps definition file or the definition itself.
         n_repeats: Number of times to repeat each sweep.
@@ -191,38 +435,84 @@ def sweeps_generate(
     Returns:
         Generator: Names and values of the sweeps.
     """
-    fn_lut = {"list": lambda *args: list(args), "range": lambda *args: range(*args)}
+    fn_lut = {
+        "list": lambda *args: lambda: args,
+        "range": lambda *args: lambda: range(*args),
+    }
     functions: Dict[str, Callable] = custom_fns if custom_fns else {}
-    sweeps: Parameter = {}
+    sweeps: Dict[str, Callable[[], Any]] = {}
 
-    modules = []
-    try:
-        import numpy as np
+    for sweep, info in sweeps_def.items():
+        name, args = info["function"], info["values"]
+        if name in fn_lut and name not in functions:
+            sweeps[sweep] = fn_lut[name](*args)
+        else:
+            values = function_resolve(name, [functions], SWEEPS_MODULES)(*args)
+            if isinstance(values, Iterator):
+                # Iterators can only be traversed once
+                values = tuple(values)
+            sweeps[sweep] = lambda values=values: values
 
-        modules.append(np)
-    except ImportError:
-        pass
+    keys = list(sweeps.keys())
+    for bundle in sweeps_product(list(sweeps.values())):
+        sweep = dict(zip(keys, bundle))
+        for _ in range(n_repeats):
+            yield sweep
 
-    for sweep, info in sweeps_def.items():
-        fns = []
-        fns.append(functions.get(info["function"], None))
-        fns.append(fn_lut.get(info["function"], None))
-        fns.extend([getattr(mod, info["function"], None) for mod in modules])
-        if not any(fns):
-            raise ValueError(f"Function {info['function']} does not exist")
 
-        fn = next(fn for fn in fns if fn is not None)
-        sweeps[sweep] = fn(*info["values"])
+def json_dumps(obj: Any) -> bytes:
+    """Serialize an object to json.
 
-    keys, values = zip(*sweeps.items())
-    for bundle in product(*values):
-        yield from [dict(zip(keys, bundle))] * n_repeats
+    orjson is used if it is installed, otherwise the json module.
+
+    Args:
+        obj: Object to serialize.
+
+    Returns:
+        Json encoded in utf-8.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj).encode()
+
+
+def json_loads(text: Union[str, bytes]) -> Any:
+    """Deserialize an object from json.
+
+    orjson is used if it is installed, otherwise the json module.
+
+    Args:
+        text: Json to deserialize.
+
+    Returns:
+        Object deserialized.
+    """
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def params_loads(text: str) -> List[Parameter]:
+    """Load a list of parameters from a json dump.
+
+    The dump can be a json list or one json object per line.
+
+    Args:
+        text: Json dump of the parameters.
+
+    Returns:
+        List of parameters.
+    """
+    if text.lstrip().startswith("["):
+        return json_loads(text)
+    return [json_loads(line) for line in text.splitlines() if line.strip()]
 
 
 def template_subs(raw: Union[Template, str], subs: Parameter) -> str:
     """Substitute a template with a list of arguments.
 
     If the argument is a string it gets converted into a Template.
+    Templates without any placeholder are returned directly.
 
     Args:
         raw: Text to be substituted. Converted automatically to Template if needed.
@@ -231,10 +521,114 @@ def template_subs(raw: Union[Template, str], subs: Parameter) -> str:
     Returns:
         The template substituted.
     """
-    if isinstance(raw, str):
-        return Template(raw).safe_substitute(subs)
-    else:
-        return raw.safe_substitute(subs)
+    tmpl = Template(raw) if isinstance(raw, str) else raw
+    if tmpl.delimiter not in tmpl.template:
+        return tmpl.template
+    return tmpl.safe_substitute(subs)
+
+
+def template_compile(raw: Union[Template, str]) -> TemplateParts:
+    """Split a template into literal text and placeholders.
+
+    The template is scanned only once. Every part is a tuple with its
+    text and the name of the placeholder, or None for literal text.
+    The parts are substituted with `template_render`.
+
+    Args:
+        raw: Template to compile. Converted automatically to Template if needed.
+
+    Returns:
+        Parts of the template.
+    """
+    tmpl = Template(raw) if isinstance(raw, str) else raw
+    text = tmpl.template
+    parts: TemplateParts = []
+    literal = ""
+    pos = 0
+
+    for m in tmpl.pattern.finditer(text):
+        literal += text[pos : m.start()]
+        pos = m.end()
+        named = m.group("named") or m.group("braced")
+        if named is not None:
+            if literal:
+                parts.append((literal, None))
+                literal = ""
+            parts.append((m.group(), named))
+        elif m.group("escaped") is not None:
+            literal += tmpl.delimiter
+        else:
+            literal += m.group()
+
+    literal += text[pos:]
+    if literal:
+        parts.append((literal, None))
+
+    return parts
+
+
+def template_values(parts: TemplateParts, subs: Parameter) -> Tuple[str, ...]:
+    """Obtain the values of the placeholders of a compiled template.
+
+    Placeholders not present in `subs` keep their original text.
+
+    Args:
+        parts: Parts of the template, obtained with `template_compile`.
+        subs: Names and values to be substituted.
+
+    Returns:
+        Values of the placeholders, in order.
+    """
+    return tuple(
+        str(subs[key]) if key in subs else text
+        for text, key in parts
+        if key is not None
+    )
+
+
+def template_join(parts: TemplateParts, values: Tuple[str, ...]) -> str:
+    """Join a compiled template with the values of its placeholders.
+
+    Args:
+        parts: Parts of the template, obtained with `template_compile`.
+        values: Values of the placeholders, obtained with `template_values`.
+
+    Returns:
+        The template substituted.
+    """
+    values_iter = iter(values)
+    return "".join(text if key is None else next(values_iter) for text, key in parts)
+
+
+def template_render(parts: TemplateParts, subs: Parameter) -> str:
+    """Substitute a compiled template.
+
+    The result is the same as `Template.safe_substitute`, placeholders
+    not present in `subs` are left untouched.
+
+    Args:
+        parts: Parts of the template, obtained with `template_compile`.
+        subs: Names and values to be substituted.
+
+    Returns:
+        The template substituted.
+    """
+    return template_join(parts, template_values(parts, subs))
+
+
+def template_read(template_path: PathStr) -> Template:
+    """Read a template from a file.
+
+    Args:
+        template_path: Path to the template file.
+
+    Raises:
+      OSError: The template file could not be found.
+
+    Returns:
+        The template read.
+    """
+    return Template(Path(template_path).read_text())
 
 
 def template_exec(input_txt: PathStr, out_file: PathStr, subs: Parameter) -> None:
@@ -253,30 +647,123 @@ def template_exec(input_txt: PathStr, out_file: PathStr, subs: Parameter) -> Non
     Returns:
         None
     """
-    with open(out_file, "w+") as result:
-        if isinstance(input_txt, Path):
-            substituted = template_subs(input_txt.read_text(), subs)
-        else:
-            substituted = template_subs(input_txt, subs)
-        result.write(substituted)
+    template = template_read(input_txt) if isinstance(input_txt, Path) else input_txt
+    Path(out_file).write_text(template_subs(template, subs))
+
+
+@lru_cache(maxsize=32)
+def command_which(executable: str) -> str:
+    """Find the absolute path of an executable.
+
+    Args:
+        executable: Name or path of the executable.
+
+    Returns:
+        Absolute path of the executable or the executable itself if not found.
+    """
+    return shutil.which(executable) or executable
 
 
-def command_run(cmd: PathStr, is_verbose: bool = False) -> None:
+def command_run(cmd: Union[PathStr, List[str]], is_verbose: bool = False) -> None:
     """Execute a given command using subprocess.run
 
+    The executable is given by its absolute path, while the arguments
+    are passed unchanged, and file descriptors are not closed, so
+    subprocess can launch it with posix_spawn instead of fork and exec.
+    Python file descriptors are not inheritable, so they are not leaked
+    to the command.
+
     Args:
-        cmd: Shell command to execute.
+        cmd: Shell command to execute or list of its arguments.
         is_verbose: Whether to show the output of the command.
 
     Returns:
         None
     """
-    command: str = cmd.read_text() if isinstance(cmd, Path) else cmd
+    if isinstance(cmd, list):
+        args = cmd
+    else:
+        command: str = cmd.read_text() if isinstance(cmd, Path) else cmd
+        args = shlex.split(command)
+    executable = command_which(args[0])
 
     if is_verbose:
-        run(shlex.split(command), check=True)
+        run(args, executable=executable, check=True, close_fds=False)
     else:
-        run(shlex.split(command), check=True, stdout=DEVNULL, stderr=DEVNULL)
+        run(
+            args,
+            executable=executable,
+            check=True,
+            stdout=DEVNULL,
+            stderr=DEVNULL,
+            close_fds=False,
+        )
+
+
+class SimulatorTimeout(TimeoutExpired):
+    """The persistent simulator did not print a token in time."""
+
+    def __str__(self) -> str:
+        return f"{super().__str__()} Last lines of output:\n{self.output}"
+
+
+def _lines_read(stream: Any, lines: Queue) -> None:
+    """Put every line of a stream in a queue, followed by None at the end.
+
+    The stream is closed at the end.
+
+    Args:
+        stream: Text stream to read.
+        lines: Queue where the lines are put.
+    """
+    with stream:
+        for line in stream:
+            lines.put(line)
+    lines.put(None)
+
+
+# Templates and command of the simulations run by a worker process
+_SIMULATION: Optional[tuple] = None
+
+
+def _simulation_init(
+    netlist_parts: TemplateParts,
+    files_parts: List[Tuple[TemplateParts, TemplateParts]],
+    argv_parts: List[TemplateParts],
+    is_verbose: bool,
+) -> None:
+    """Store the templates of the simulations in a worker process.
+
+    The templates are sent once per worker instead of once per simulation.
+
+    Args:
+        netlist_parts: Compiled template of the netlist.
+        files_parts: Compiled output paths and templates of additional files.
+        argv_parts: Compiled arguments of the simulator command.
+        is_verbose: Whether to show the output of the command.
+    """
+    global _SIMULATION
+    _SIMULATION = (netlist_parts, files_parts, argv_parts, is_verbose)
+
+
+def _simulation_run(subs: Parameter) -> None:
+    """Substitute the templates and run a simulation in a worker process.
+
+    The netlist of the simulation is removed once it has run.
+
+    Args:
+        subs: Substitutions of the simulation.
+    """
+    netlist_parts, files_parts, argv_parts, is_verbose = _SIMULATION
+    netlist = Path(subs["netlist"])
+    netlist.write_text(template_render(netlist_parts, subs))
+    try:
+        for out_parts, parts in files_parts:
+            file_out = Path(template_render(out_parts, subs))
+            file_out.write_text(template_render(parts, subs))
+        command_run([template_render(arg, subs) for arg in argv_parts], is_verbose)
+    finally:
+        netlist.unlink(missing_ok=True)
 
 
 ################################################################################
@@ -298,21 +785,49 @@ class SimBuilder:
 
         self.__netlist: Path = self.project_path / f"{self.project_name}.netlist"
         self.__netlist_out: Path = self.project_path / f"{self.project_name}_net_out"
+        self.__static_subs: Parameter = {}
+        self.__static_state: Optional[tuple] = None
 
         self.__custom_fns: Dict[str, Callable] = {}
         self.__is_parametric: bool = False
         self.__is_sweeps: bool = False
         self.__params_def: ParameterDef = {}
+        self.__params_compiled: Optional[List[Tuple[str, Callable, tuple]]] = None
+        self.__params_batch: Optional[Iterator[Parameter]] = None
+        self.__params_batch_left: int = 0
         self.__sweeps_def: ParameterDef = {}
+        self.__sweeps_ahead: deque = deque()
 
         self.__files = {}
 
         self.__cmd: Optional[str] = None
+        self.__netlist_parts: Optional[TemplateParts] = None
+        self.__files_parts: Dict[
+            str, Tuple[TemplateParts, Optional[TemplateParts]]
+        ] = {}
+        self.__files_static: Dict[str, str] = {}
+        self.__files_static_copied: Set[str] = set()
+        self.__cmd_parts: Optional[TemplateParts] = None
+        self.__cmd_argv_parts: Optional[List[TemplateParts]] = None
+        self.__sim_cmd: Optional[str] = None
+        self.__sim_ready: Optional[str] = None
+        self.__sim_done: Optional[Template] = None
+        self.__sim_timeout: Optional[float] = None
+        self.__proc: Optional[Popen] = None
+        self.__proc_lines: Optional[Queue] = None
+        self.__proc_reader: Optional[threading.Thread] = None
+        self.__result_cache: Optional[Dict[bytes, Path]] = None
+        self.__result_dir: Optional[tempfile.TemporaryDirectory] = None
+        self.__result_outputs: List[TemplateParts] = []
+        self.__outputs_last: Dict[
+            Path, Tuple[TemplateParts, Tuple[str, ...], Tuple[int, int]]
+        ] = {}
         self.is_verbose = False
 
         self.__props: Dict[str, Any] = {}
         self.__sweeps: Optional[Generator[Parameter, None, None]] = None
         self.__params: Union[Generator[Parameter, None, None], List[Parameter]] = []
+        self.__params_stream: Optional[BinaryIO] = None
 
     def __repr__(self) -> str:
         """Pretty print the SimBuiler"""
@@ -331,9 +846,12 @@ class SimBuilder:
                 f"Command: {self.__cmd}"
             )
 
+            if self.__sim_cmd is not None:
+                txt = f"{txt}\nPersistent simulator: {self.__sim_cmd}"
+
             if self.__files:
                 txt = f"{txt}\nList of additional files:\n"
-                for in_file, out_file in self.__files:
+                for in_file, out_file in self.__files.items():
                     txt += f"{in_file}: {out_file}\n"
 
         return txt
@@ -357,10 +875,10 @@ class SimBuilder:
             Path to the input file or the string itself.
         """
         if file_input is None:
-            files = files_find_ext(ext, self.project_path)
-            if not files:
+            file_default = next(files_find_ext(ext, self.project_path), None)
+            if file_default is None:
                 raise ValueError(f"Template for {ext} not found.")
-            return files[0]
+            return file_default
         elif Path(file_input).exists():
             return Path(file_input)
         elif isinstance(file_input, str):
@@ -398,9 +916,13 @@ class SimBuilder:
                 Path(file_path).touch(mode=0o666, exist_ok=True)
 
         self.__netlist = netlist_file
+        self.__netlist_parts = None
         self.__params_def = {}
+        self.__params_compiled = None
+        self.__params_batch = None
         self.__sweeps_def = {}
         self.__sweeps = None
+        self.__sweeps_ahead.clear()
         self.__params = []
 
     def with_props(self, props: Dict[str, Any], reset: bool = True) -> None:
@@ -430,6 +952,21 @@ class SimBuilder:
         if not Path(netlist_path).exists():
             raise ValueError(f"Netlist {netlist_path} does not exist")
         self.__netlist = netlist_path
+        self.__netlist_parts = template_compile(template_read(netlist_path))
+
+    def __netlist_compiled(self) -> TemplateParts:
+        """Obtain the compiled template of the netlist.
+
+        The netlist is only read the first time it is needed, so the
+        default netlist and the one created by `scaffold` can be edited
+        before running the simulations.
+
+        Returns:
+            Compiled template of the netlist.
+        """
+        if self.__netlist_parts is None:
+            self.__netlist_parts = template_compile(template_read(self.__netlist))
+        return self.__netlist_parts
 
     def with_custom_fns(
         self, custom_fns: Dict[str, Callable], reset: bool = True
@@ -450,10 +987,18 @@ class SimBuilder:
             self.__custom_fns = custom_fns
         else:
             self.__custom_fns.update(custom_fns)
+        self.__params_compiled = None
+        self.__params_batch = None
 
     def with_simulator(self, command: PathStr = None) -> None:
         """Assign the simulatior command.
 
+        The command is split into arguments before substituting it, so a
+        value containing spaces is passed to the simulator as a single
+        argument.
+
+        The lines of a command file are joined with spaces.
+
         Args:
             command: String with the command to execute
                 or a path to a file whose contents is the command.
@@ -463,7 +1008,190 @@ class SimBuilder:
         if isinstance(cmd, str):
             self.__cmd = cmd
         else:
-            self.__cmd = cmd.read_text().replace("\n", " ")
+            with open(cmd, "r") as cmd_fd:
+                self.__cmd = " ".join(l.strip() for l in cmd_fd if l.strip())
+        self.__cmd_parts = template_compile(self.__cmd)
+        self.__cmd_argv_parts = None
+
+    def with_persistent_simulator(
+        self,
+        command: str,
+        done_token: str,
+        ready_token: Optional[str] = None,
+        timeout: Optional[float] = 600,
+    ) -> None:
+        """Run every simulation in a single long-lived simulator process.
+
+        The simulator is launched once with `command`. On every run, the
+        command defined with `with_simulator` is substituted and written to
+        the stdin of the simulator, and the run finishes when a line of its
+        output contains `done_token`. The done token is substituted too, so
+        it can contain variables like `${iteration}`.
+
+        The simulator is closed with `close_simulator` or when leaving a
+        `with` block on the builder.
+
+        Args:
+            command: Shell command to launch the simulator.
+            done_token: Text printed by the simulator when a run finishes.
+            ready_token: Text printed by the simulator when it is ready to
+                receive commands. If None, the simulator is not waited for.
+            timeout: Seconds to wait for a token before killing the
+                simulator. If None, wait forever.
+
+        Returns:
+            None
+        """
+        self.close_simulator()
+        self.__sim_cmd = command
+        self.__sim_done = Template(done_token)
+        self.__sim_ready = ready_token
+        self.__sim_timeout = timeout
+
+    def open_simulator(self) -> None:
+        """Launch the persistent simulator if it is not running.
+
+        This method is called automatically by `run_single`.
+
+        Raises:
+            ValueError: If the persistent simulator has not been defined.
+            CalledProcessError: If the simulator exits before being ready.
+            SimulatorTimeout: If the simulator is not ready in time.
+
+        Returns:
+            None
+        """
+        if self.__sim_cmd is None:
+            raise ValueError("Persistent simulator has not been defined")
+        if self.__proc is not None and self.__proc.poll() is None:
+            return
+
+        self.__proc = Popen(
+            shlex.split(self.__sim_cmd),
+            stdin=PIPE,
+            stdout=PIPE,
+            stderr=None if self.is_verbose else DEVNULL,
+            universal_newlines=True,
+            bufsize=1,
+        )
+        # The output is read by a thread, so the wait for a token can time out
+        self.__proc_lines = Queue()
+        self.__proc_reader = threading.Thread(
+            target=_lines_read,
+            args=(self.__proc.stdout, self.__proc_lines),
+            daemon=True,
+        )
+        self.__proc_reader.start()
+        if self.__sim_ready is not None:
+            self.__simulator_wait(self.__sim_ready)
+
+    def close_simulator(self) -> None:
+        """Close the stdin of the persistent simulator and wait for it to exit.
+
+        The simulator is killed if it does not exit within the timeout. Its
+        output is closed by the thread reading it once the pipe ends, which
+        is never waited for, since children of the simulator may keep it open.
+
+        Returns:
+            None
+        """
+        if self.__proc is None:
+            return
+        try:
+            self.__proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.__proc.wait(self.__sim_timeout)
+        except TimeoutExpired:
+            self.__proc.kill()
+            self.__proc.wait()
+        self.__proc = None
+        self.__proc_lines = None
+        self.__proc_reader = None
+
+    def __enter__(self) -> "SimBuilder":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close_simulator()
+
+    def __simulator_wait(self, token: str) -> None:
+        """Read the output of the persistent simulator until a token is found.
+
+        Args:
+            token: Text to look for in the output.
+
+        Raises:
+            CalledProcessError: If the simulator exits before printing the token.
+            SimulatorTimeout: If the token is not printed within the timeout.
+                The simulator is killed.
+        """
+        last_lines: deque = deque(maxlen=20)
+        timeout = self.__sim_timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                if deadline is None:
+                    line = self.__proc_lines.get()
+                else:
+                    line = self.__proc_lines.get(
+                        timeout=max(0, deadline - time.monotonic())
+                    )
+            except Empty:
+                self.__proc.kill()
+                self.close_simulator()
+                raise SimulatorTimeout(
+                    self.__sim_cmd, timeout, output="".join(last_lines)
+                ) from None
+
+            if line is None:
+                returncode = self.__proc.wait()
+                self.close_simulator()
+                raise CalledProcessError(
+                    returncode, self.__sim_cmd, output="".join(last_lines)
+                )
+            if self.is_verbose:
+                print(line, end="")
+            if token in line:
+                return
+            last_lines.append(line)
+
+    def with_result_cache(
+        self, enabled: bool = True, outputs: Optional[List[PathStr]] = None
+    ) -> None:
+        """Skip simulations whose inputs are identical to a previous one.
+
+        When enabled, a simulation is not run again if the netlist, the
+        additional files and the command are the same than in a previous
+        simulation. Instead, the outputs it wrote are copied back from a
+        temporary directory.
+
+        The outputs are paths that can contain variables, relative to
+        `results_path` if they are not absolute. Only declare files that a
+        single simulation writes entirely, since they are overwritten when
+        restored. Other files are never saved or restored.
+
+        Only enable it if the simulator is deterministic. Inputs that change
+        on every simulation, like `${iteration}`, never skip a simulation.
+
+        Args:
+            enabled: Whether to skip repeated simulations.
+            outputs: Files written by every simulation.
+
+        Returns:
+            None
+        """
+        if self.__result_dir is not None:
+            self.__result_dir.cleanup()
+        if enabled:
+            self.__result_cache = {}
+            self.__result_dir = tempfile.TemporaryDirectory(prefix="monaco_")
+            self.__result_outputs = [template_compile(str(o)) for o in outputs or []]
+        else:
+            self.__result_cache = None
+            self.__result_dir = None
+            self.__result_outputs = []
 
     def load_parameters(self, parameters: Union[List[Parameter], str, Path]) -> None:
         """Load parameters that are already created.
@@ -474,7 +1202,8 @@ class SimBuilder:
 
         The parameters can be supplied as a list of dictionaries, a Path pointing
         to a file containing a json dump of the parameters or a string, containing
-        also a json dump.
+        also a json dump. The files written by `save_parameters_stream`,
+        with one json object per line, are also accepted.
 
         Args:
             params: Path to the parameters or the definition itself.
@@ -482,9 +1211,9 @@ class SimBuilder:
         if isinstance(parameters, list):
             params = parameters
         elif Path(parameters).exists():
-            params = json.loads(Path(parameters).read_text())
+            params = params_loads(Path(parameters).read_text())
         elif isinstance(parameters, str):
-            params = json.loads(parameters)
+            params = params_loads(parameters)
 
         if self.__params_def.keys() != params[0].keys():
             raise ValueError(
@@ -507,8 +1236,32 @@ class SimBuilder:
         if isinstance(self.__params, Iterator):
             return
 
-        with open(param_path, "w+") as fd:
-            fd.write(json.dumps(self.__params))
+        Path(params_path).write_bytes(json_dumps(self.__params))
+
+    def save_parameters_stream(
+        self, params_path: Optional[PathStr], append: bool = False
+    ) -> None:
+        """Save the parameters to a file as soon as they are generated.
+
+        Every set of parameters is written to the file as a json object
+        in its own line. The parameters are not kept in memory, so
+        `save_parameters` will not save them. If `params_path` is None,
+        the file being written is closed.
+
+        Args:
+            params_path: Path to the parameters file to be written.
+            append: Whether to keep the parameters already in the file
+                instead of overwriting it.
+
+        Returns:
+            None
+        """
+        if self.__params_stream is not None:
+            self.__params_stream.close()
+            self.__params_stream = None
+
+        if params_path is not None:
+            self.__params_stream = open(params_path, "ab" if append else "wb")
 
     def with_parametric(self, params_path: Path = None) -> None:
         """Assign the paremeters definitions.
@@ -527,6 +1280,8 @@ class SimBuilder:
 
         self.__is_parametric = True
         self.__params_def = params_parse(params)
+        self.__params_compiled = None
+        self.__params_batch = None
         self.__params = []
 
     def with_sweeps(self, sweeps_path: Path = None, n_repeats: int = 1) -> None:
@@ -550,10 +1305,19 @@ class SimBuilder:
         self.__is_sweeps = True
         self.__sweeps_def = params_parse(sweeps)
         self.__sweeps = sweeps_generate(self.__sweeps_def, self.__custom_fns, n_repeats)
+        self.__sweeps_ahead.clear()
 
     def with_files(self, files: dict, reset: bool = True) -> None:
         """Assign a list of files to inject values
 
+        The files are read and compiled once, so they are not read again
+        on every simulation. The output paths are substituted too, so they
+        can contain variables like `${iteration}`. Files without any
+        variable, whose output path has no variable either, are copied on
+        the first simulation after they are assigned and copied again if
+        the output has been removed. The input `netlist` refers to the
+        netlist of the builder.
+
         Args:
             files: Dictionary containing the input path and the output path
                 of external files to be also substituted.
@@ -563,28 +1327,231 @@ class SimBuilder:
         Returns:
             None
         """
+        parts: Dict[str, Tuple[TemplateParts, Optional[TemplateParts]]] = {}
+        static: Dict[str, str] = {}
+        for file_in, file_out in files.items():
+            out_parts = template_compile(str(file_out))
+            if file_in == "netlist":
+                parts[str(file_out)] = (out_parts, None)
+                continue
+
+            tmpl = template_read(file_in)
+            if tmpl.delimiter in tmpl.template or tmpl.delimiter in str(file_out):
+                parts[str(file_out)] = (out_parts, template_compile(tmpl))
+            else:
+                static[str(file_out)] = str(file_in)
+
         if reset:
             self.__files = files
+            self.__files_parts = parts
+            self.__files_static = static
+            self.__files_static_copied = set()
         else:
             self.__files.update(files)
-
-    def run_iterations(self, iterations: int) -> Generator:
+            for file_out in static:
+                self.__files_parts.pop(file_out, None)
+            for file_out in parts:
+                self.__files_static.pop(file_out, None)
+            self.__files_parts.update(parts)
+            self.__files_static.update(static)
+            self.__files_static_copied.difference_update(static)
+
+    def __files_static_copy(self) -> None:
+        """Copy the files without variables not copied since they were assigned."""
+        for file_out, file_in in self.__files_static.items():
+            if file_out in self.__files_static_copied and Path(file_out).exists():
+                continue
+            shutil.copyfile(file_in, file_out)
+            self.__files_static_copied.add(file_out)
+
+    def run_iterations(self, iterations: Optional[int]) -> Generator:
         """Run a number of iterations.
 
+        The iterations stop when the parameters loaded or the sweeps
+        have been exhausted.
+
+        When the number of iterations is given, the parameters generated
+        by numpy.random are generated in batches, so the values obtained
+        after seeding numpy are not the same than with `run_single`.
+
         Args:
-            iterations: Number of iterations to run
+            iterations: Number of iterations to run. If None, run until
+                the parameters or the sweeps are exhausted.
+
+        Raises:
+            ValueError: If the simulation command has not been defined.
 
         Returns:
             Generator: Generator for every single simulation.
         """
+        if self.__cmd is None:
+            raise ValueError("Simulation command has not been defined")
+
         if isinstance(iterations, int):
-            for i in range(1, iterations + 1):
-                yield self.run_single(i)
+            self.__params_batch_start(iterations)
+            run_ids: Iterator[int] = iter(range(1, iterations + 1))
         else:
-            count = 1
-            while True:
-                yield from self.run_single(count)
-                count += 1
+            run_ids = count(1)
+
+        try:
+            for run_id, (params, sweeps, subs_dict) in zip(run_ids, self.iter_subs()):
+                subs_dict["iteration"] = run_id
+                yield self.__run(params, sweeps, subs_dict)
+        finally:
+            self.__params_batch_start(0)
+
+    def run_iterations_parallel(
+        self, iterations: int, workers: Optional[int] = None
+    ) -> Generator:
+        """Run a number of iterations in parallel.
+
+        The substitutions of all the iterations are generated first and
+        then the simulations are run by a pool of processes. The results
+        are returned in the same order than with `run_iterations`.
+
+        The netlist of every iteration is written to its own file, which
+        is available as `${netlist}` and removed once the iteration has
+        run. The output paths of additional files
+        have to contain `${iteration}` or `${netlist}`, so they do not
+        overwrite each other. Additional files without any variable are
+        copied once before the simulations.
+        The persistent simulator and the result cache are not used.
+
+        Args:
+            iterations: Number of iterations to run.
+            workers: Number of processes to use. By default, the number of CPUs.
+
+        Raises:
+            ValueError: If the output path of an additional file does not
+                contain `${iteration}` or `${netlist}`.
+
+        Returns:
+            Generator: Generator for every single simulation.
+        """
+        if self.__cmd is None:
+            raise ValueError("Simulation command has not been defined")
+
+        netlist_parts = self.__netlist_compiled()
+        files_parts = []
+        for file_out, (out_parts, parts) in self.__files_parts.items():
+            if not any(key in ("iteration", "netlist") for _, key in out_parts):
+                raise ValueError(f"Output {file_out} is the same for every iteration")
+            files_parts.append((out_parts, netlist_parts if parts is None else parts))
+
+        self.__files_static_copy()
+        # The outputs are written by the workers, so they may have changed
+        self.__outputs_last.clear()
+        self.__params_batch_start(iterations)
+        runs = []
+        try:
+            for run_id, subs in zip(range(1, iterations + 1), self.iter_subs()):
+                subs[2]["iteration"] = run_id
+                subs[2]["netlist"] = f"{self.__netlist_out}_{run_id}"
+                runs.append(subs)
+        finally:
+            self.__params_batch_start(0)
+
+        workers = workers if workers else cpu_count() or 1
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_simulation_init,
+            initargs=(
+                netlist_parts,
+                files_parts,
+                self.__cmd_argv_compiled(),
+                self.is_verbose,
+            ),
+        ) as executor:
+            results = executor.map(
+                _simulation_run,
+                [subs_dict for _, _, subs_dict in runs],
+                chunksize=max(1, len(runs) // (workers * 4)),
+            )
+            for (params, sweeps, _), _ in zip(runs, results):
+                yield params, sweeps
+
+    def iter_subs(
+        self,
+    ) -> Iterator[Tuple[Optional[Parameter], Optional[Parameter], Parameter]]:
+        """Generate the substitutions for the next simulations.
+
+        The generator stops when the parameters loaded or the sweeps
+        have been exhausted.
+
+        Returns:
+            Iterator: Parameters, sweeps and substitutions of every simulation.
+        """
+        while True:
+            try:
+                yield self.__next_subs()
+            except StopIteration:
+                return
+
+    def __params_compiled_get(self) -> List[Tuple[str, Callable, tuple]]:
+        """Obtain the compiled parameter definitions.
+
+        Returns:
+            List of names, functions and arguments of the parameters.
+        """
+        if self.__params_compiled is None:
+            self.__params_compiled = params_compile(
+                self.__params_def, self.__custom_fns
+            )
+        return self.__params_compiled
+
+    def __params_batch_start(self, n: int) -> None:
+        """Generate the parameters of the next simulations in batches.
+
+        Only the parameters generated by numpy.random are batched, in
+        batches of at most `PARAMS_BATCH_SIZE` runs, and the rest are
+        generated on every run. When there are sweeps, the batch is sized
+        to the sweeps left, so no values are generated for runs that do
+        not happen. Values left from a previous batch are discarded.
+
+        Args:
+            n: Number of simulations to batch. If 0, batching stops.
+        """
+        self.__params_batch = None
+        self.__params_batch_left = n
+
+    def __params_batch_next(self) -> Optional[Parameter]:
+        """Obtain the batched parameters of the next simulation.
+
+        The current sweep has to be pulled before calling this method.
+
+        Returns:
+            Values of the batched parameters, or None if not batching.
+        """
+        if self.__params_batch_left <= 0:
+            return None
+
+        row = None if self.__params_batch is None else next(self.__params_batch, None)
+        if row is None:
+            batched = [
+                (name, fn, args)
+                for name, fn, args in self.__params_compiled_get()
+                if params_is_batchable(fn, args)
+            ]
+            if not batched:
+                self.__params_batch_left = 0
+                return None
+
+            n = min(self.__params_batch_left, PARAMS_BATCH_SIZE)
+            if self.__is_sweeps:
+                missing = n - 1 - len(self.__sweeps_ahead)
+                if missing > 0:
+                    self.__sweeps_ahead.extend(islice(self.__sweeps, missing))
+                n = min(n, len(self.__sweeps_ahead) + 1)
+
+            batch = params_sample_batch(batched, n)
+            keys = list(batch.keys())
+            self.__params_batch = (
+                dict(zip(keys, values)) for values in zip(*batch.values())
+            )
+            row = next(self.__params_batch)
+
+        self.__params_batch_left -= 1
+        return row
 
     def run_single(
         self, run_id: Optional[int] = None
@@ -594,13 +1561,45 @@ class SimBuilder:
         Args:
             iteration: Index of the iteration if multiple are to be run.
 
+        Raises:
+            ValueError: If the simulation command has not been defined.
+            StopIteration: The parameters loaded or the sweeps have been exhausted.
+
         Returns:
             Parameters and sweeps for the run
         """
         if self.__cmd is None:
             raise ValueError("Simulation command has not been defined")
 
-        subs_dict: Parameter = {}
+        params, sweeps, subs_dict = self.__next_subs()
+        if run_id is not None:
+            subs_dict["iteration"] = run_id
+        return self.__run(params, sweeps, subs_dict)
+
+    def __next_subs(
+        self,
+    ) -> Tuple[Optional[Parameter], Optional[Parameter], Parameter]:
+        """Obtain the parameters, sweeps and substitutions for the next simulation.
+
+        Raises:
+            StopIteration: The parameters loaded or the sweeps have been exhausted.
+
+        Returns:
+            Parameters, sweeps and substitutions of the simulation.
+        """
+        # The sweeps are pulled first, so that no parameters are generated
+        # and recorded for a simulation that is not going to run
+        if self.__is_sweeps:
+            try:
+                if self.__sweeps_ahead:
+                    sweeps = self.__sweeps_ahead.popleft()
+                else:
+                    sweeps = next(self.__sweeps)
+            except StopIteration as e:
+                raise StopIteration("Can not run any more sweeps") from e
+        else:
+            sweeps = None
+
         if self.__is_parametric:
             if isinstance(self.__params, Iterator):
                 try:
@@ -608,50 +1607,195 @@ class SimBuilder:
                 except StopIteration as e:
                     raise StopIteration("Can not run any more paremeters") from e
             else:
-                params = params_generate(self.__params_def, self.__custom_fns)
-                self.__params.append(params)
-
-            subs_dict.update(params)
+                row = self.__params_batch_next() or {}
+                params = {
+                    name: row[name] if name in row else fn(*args)
+                    for name, fn, args in self.__params_compiled_get()
+                }
+                if self.__params_stream is not None:
+                    self.__params_stream.write(json_dumps(params) + b"\n")
+                    self.__params_stream.flush()
+                else:
+                    self.__params.append(params)
+            subs_dict: Parameter = dict(params)
         else:
             params = None
+            subs_dict = {}
 
-        if self.__is_sweeps:
-            try:
-                sweeps = next(self.__sweeps)
-                subs_dict.update(sweeps)
-            except StopIteration as e:
-                raise StopIteration("Can not run any more sweeps") from e
-        else:
-            sweeps = None
+        if sweeps is not None:
+            subs_dict.update(sweeps)
+        subs_dict.update(self.__static_subs_get())
+        for key, value in self.__props.items():
+            subs_dict.setdefault(key, value)
+
+        return params, sweeps, subs_dict
+
+    def __static_subs_get(self) -> Parameter:
+        """Obtain the substitutions that are the same for every simulation.
 
-        subs_dict.update(
-            {
+        They are computed again only when one of the attributes they come
+        from has been reassigned.
+
+        Returns:
+            Substitutions of the netlist, results and project paths.
+        """
+        state = (
+            self.__netlist_out,
+            self.results_path,
+            self.project_name,
+            self.project_path,
+        )
+        if state != self.__static_state:
+            self.__static_subs = {
                 "netlist": str(self.__netlist_out),
                 "results": str(self.results_path),
                 "project": str(self.project_name),
                 "project_path": str(self.project_path),
             }
-        )
-        if run_id is not None:
-            subs_dict.update({"iteration": run_id})
-
-        for key, value in self.__props:
-            if key not in subs_dict:
-                subs_dict[key] = value
+            self.__static_state = state
+        return self.__static_subs
+
+    def __run(
+        self,
+        params: Optional[Parameter],
+        sweeps: Optional[Parameter],
+        subs_dict: Parameter,
+    ) -> Tuple[Optional[Parameter], Optional[Parameter]]:
+        """Substitute the templates and run the simulator.
 
-        template_exec(self.__netlist, self.__netlist_out, subs_dict)
+        Args:
+            params: Parameters of the simulation.
+            sweeps: Sweeps of the simulation.
+            subs_dict: Substitutions of the simulation.
 
-        for file_in, file_out in self.__files:
-            if file_in == "netlist":
-                template_exec(self.__netlist, str(file_out), subs_dict)
-            else:
-                template_exec(str(file_in), str(file_out), subs_dict)
+        Returns:
+            Parameters and sweeps for the run
+        """
+        netlist_parts = self.__netlist_compiled()
+        outputs = [(self.__netlist_out, netlist_parts)]
+        for out_parts, parts in self.__files_parts.values():
+            file_out = Path(template_render(out_parts, subs_dict))
+            outputs.append((file_out, netlist_parts if parts is None else parts))
+        rendered = [
+            (file_out, parts, template_values(parts, subs_dict))
+            for file_out, parts in outputs
+        ]
+        if self.__sim_cmd is not None:
+            command = template_render(self.__cmd_parts, subs_dict)
+        else:
+            command = [
+                template_render(arg, subs_dict) for arg in self.__cmd_argv_compiled()
+            ]
+
+        cached: Optional[Path] = None
+        if self.__result_cache is not None:
+            texts = [(f, template_join(p, v)) for f, p, v in rendered]
+            run_key = self.__run_digest(texts, command)
+            cached = self.__result_cache.get(run_key)
+
+        self.__files_static_copy()
+        for file_out, parts, values in rendered:
+            self.__output_write(file_out, parts, values)
+
+        if cached is not None:
+            for idx, file_out in enumerate(self.__result_paths(subs_dict)):
+                saved = cached / str(idx)
+                if saved.exists():
+                    file_out.parent.mkdir(parents=True, exist_ok=True)
+                    shutil.copyfile(saved, file_out)
+            return params, sweeps
+
+        if self.__sim_cmd is not None:
+            self.open_simulator()
+            self.__proc.stdin.write(f"{command}\n")
+            self.__simulator_wait(self.__sim_done.safe_substitute(subs_dict))
+        else:
+            command_run(command, self.is_verbose)
 
-        command = Template(self.__cmd).safe_substitute(subs_dict)
-        command_run(command, self.is_verbose)
+        if self.__result_cache is not None:
+            saved = Path(self.__result_dir.name) / run_key.hex()
+            saved.mkdir()
+            for idx, file_out in enumerate(self.__result_paths(subs_dict)):
+                if file_out.exists():
+                    shutil.copyfile(file_out, saved / str(idx))
+            self.__result_cache[run_key] = saved
 
         return params, sweeps
 
+    def __result_paths(self, subs_dict: Parameter) -> List[Path]:
+        """Obtain the outputs of a simulation saved by the result cache.
+
+        Args:
+            subs_dict: Substitutions of the simulation.
+
+        Returns:
+            Paths of the outputs.
+        """
+        return [
+            self.results_path / template_render(parts, subs_dict)
+            for parts in self.__result_outputs
+        ]
+
+    def __cmd_argv_compiled(self) -> List[TemplateParts]:
+        """Obtain the compiled arguments of the simulator command.
+
+        Returns:
+            Compiled template of every argument.
+        """
+        if self.__cmd_argv_parts is None:
+            self.__cmd_argv_parts = [
+                template_compile(arg) for arg in shlex.split(self.__cmd)
+            ]
+        return self.__cmd_argv_parts
+
+    def __output_write(
+        self, file_out: Path, parts: TemplateParts, values: Tuple[str, ...]
+    ) -> None:
+        """Write a compiled template to a file.
+
+        The file is not written again if the template and the values are
+        the same than the last time it was written, and its modification
+        time and size have not changed since.
+
+        Args:
+            file_out: Path to the file to write.
+            parts: Parts of the template.
+            values: Values of the placeholders of the template.
+        """
+        last = self.__outputs_last.get(file_out)
+        if last is not None and last[0] is parts and last[1] == values:
+            try:
+                st = file_out.stat()
+                if (st.st_mtime_ns, st.st_size) == last[2]:
+                    return
+            except OSError:
+                pass
+
+        file_out.write_text(template_join(parts, values))
+        st = file_out.stat()
+        self.__outputs_last[file_out] = (parts, values, (st.st_mtime_ns, st.st_size))
+
+    @staticmethod
+    def __run_digest(
+        outputs: List[Tuple[Path, str]], command: Union[str, List[str]]
+    ) -> bytes:
+        """Compute a digest of all the inputs of a simulation.
+
+        Args:
+            outputs: Paths and contents of the files to be written.
+            command: Command to execute or its arguments.
+
+        Returns:
+            Digest of the simulation.
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        for file_out, text in outputs:
+            digest.update(f"{file_out}\0{text}\0".encode())
+        if isinstance(command, list):
+            command = "\0".join(command)
+        digest.update(command.encode())
+        return digest.digest()
+
 
 if __name__ == "__main__":
     import argparse
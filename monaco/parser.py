@@ -6,28 +6,151 @@
 # Last modified: August 2010
 
 
+import functools
 import re
 import sys
+from enum import IntEnum
 from pathlib import Path
-from typing import Union, List, Optional
+from typing import Any, Callable, Dict, Union, List, NamedTuple, Optional, Tuple, Type
+
+
+class TokenType(IntEnum):
+    """Types of the tokens produced by the lexer"""
+
+    NEWLINE = 0
+    SPACE = 1
+    COMMENT = 2
+    NUMBER = 3
+    TRUE = 4
+    FALSE = 5
+    EQUAL = 6
+    PLUS = 7
+    MINUS = 8
+    MULT = 9
+    LP = 10
+    RP = 11
+    LB = 12
+    RB = 13
+    DEFINE = 14
+    FOR = 15
+    UNDEF = 16
+    IF = 17
+    IFNOT = 18
+    ELSE = 19
+    END = 20
+    VAR = 21
+    IDENTIFIER = 22
+    ERROR = 23
+
+
+# Rules of the lexer, tried in order
+_RULES = [
+    (r"[\r\n]+", "NEWLINE"),
+    (r"\s+", "SPACE"),
+    (r"#+", "COMMENT"),
+    (r"\d+", "NUMBER"),
+    (r"[Tt]rue", "TRUE"),
+    (r"[Ff]alse", "FALSE"),
+    # Punctuation is told apart by _PUNCT_TYPES after matching
+    (r"[=+\-*()\[\]]", None),
+    # Directives are told apart from variables after matching
+    (r"\.\.\w+::", "VAR"),
+    (r"[a-zA-Z_0-9]+", "IDENTIFIER"),
+    (r".", "ERROR"),
+]
+# Type of the token matched by each group, indexed by Match.lastindex
+_GROUP_TYPE: Tuple[Optional[TokenType], ...] = (None,) + tuple(
+    None if type is None else TokenType[type] for _, type in _RULES
+)
+_REGEX = re.compile("|".join(f"({regex})" for regex, _ in _RULES))
+
+# Types of the punctuation and the directives, told apart after matching
+_PUNCT_TYPES = {
+    "=": TokenType.EQUAL,
+    "+": TokenType.PLUS,
+    "-": TokenType.MINUS,
+    "*": TokenType.MULT,
+    "(": TokenType.LP,
+    ")": TokenType.RP,
+    "[": TokenType.LB,
+    "]": TokenType.RB,
+}
+_DIRECTIVE_TYPES = {
+    "define": TokenType.DEFINE,
+    "for": TokenType.FOR,
+    "undef": TokenType.UNDEF,
+    "if": TokenType.IF,
+    "ifnot": TokenType.IFNOT,
+    "else": TokenType.ELSE,
+    "end": TokenType.END,
+}
+
+# Aliases of the token types, faster to look up than the enum attributes
+_NEWLINE = TokenType.NEWLINE
+_SPACE = TokenType.SPACE
+_COMMENT = TokenType.COMMENT
+_NUMBER = TokenType.NUMBER
+_TRUE = TokenType.TRUE
+_FALSE = TokenType.FALSE
+_LB = TokenType.LB
+_RB = TokenType.RB
+_FOR = TokenType.FOR
+_IF = TokenType.IF
+_IFNOT = TokenType.IFNOT
+_ELSE = TokenType.ELSE
+_END = TokenType.END
+_VAR = TokenType.VAR
+_IDENTIFIER = TokenType.IDENTIFIER
+_ERROR = TokenType.ERROR
+
+_BLANKS = frozenset((_SPACE, _NEWLINE))
+# Values that repeat a lot across a template, shared with sys.intern
+_INTERNED = frozenset((_NEWLINE, _SPACE, _IDENTIFIER, _VAR))
+_OPENERS = frozenset((_FOR, _IF, _IFNOT))
+_LINE_DIRECTIVES = frozenset((_COMMENT, TokenType.DEFINE, TokenType.UNDEF))
+_BLOCK_TYPES = _OPENERS | _LINE_DIRECTIVES | {_NEWLINE, _ELSE, _END}
+
+# Text without directives, variables, comments or invalid characters
+_PLAIN_RE = re.compile(r"[a-zA-Z_0-9\d=+\-*()\[\]\s]*")
+# Whitespace after a newline, which is dropped from the output
+_INDENT_RE = re.compile(r"[\r\n][^\S\r\n]")
+
+
+_TOKEN_VALUE: Dict[TokenType, Callable[[str], Union[int, bool]]] = {
+    TokenType.NUMBER: int,
+    TokenType.TRUE: lambda _: True,
+    TokenType.FALSE: lambda _: False,
+}
+
+
+def token_value(token: "Token") -> Union[str, int, bool]:
+    """Return the value of a token as the proper type.
+
+    Args:
+        token: Token to obtain the value from.
+
+    Returns:
+        Casted value of the token.
+    """
+    cast = _TOKEN_VALUE.get(token.type, None)
+    return token.val if cast is None else cast(token.val)
 
 
-class Token(object):
+class Token(NamedTuple):
     """Class to represent a token"""
 
-    def __init__(self, type, val):
-        self.type = type
-        self.val = val
+    type: TokenType
+    val: str
 
-    def __str__(self):
-        if self.type == "NEWLINE":
-            return f"{self.type}"
-        elif self.type == "SPACE":
-            return f"{self.type}"
+    def __str__(self) -> str:
+        if self.type == TokenType.NEWLINE:
+            return f"{self.type.name}"
+        elif self.type == TokenType.SPACE:
+            return f"{self.type.name}"
         else:
-            return f"{self.type}({self.val})"
+            return f"{self.type.name}({self.val})"
 
-    def __repr__(self):
+    def __repr__(self) -> str:
         return str(self)
 
     def value(self) -> Union[str, int, bool]:
@@ -36,80 +159,493 @@ class Token(object):
         Returns:
             Casted value of the token.
         """
-        if self.type == "NUMBER":
-            return int(self.val)
-        if self.type == "TRUE":
-            return True
-        if self.type == "FALSE":
-            return False
-        else:
-            return self.val
+        return token_value(self)
 
 
 class ParserError(Exception):
     pass
 
 
+def _match_token(m: "re.Match") -> Token:
+    """Obtain the token of a match of the lexer regex.
+
+    Args:
+        m: Match of the lexer regex.
+
+    Raises:
+        ParserError: The match is a character without any rule.
+
+    Returns:
+        Token of the match.
+    """
+    # Every rule is a group, so lastindex is never None
+    tok_type, val = _GROUP_TYPE[m.lastindex], m.group()  # type: ignore[index]
+    if tok_type is None:
+        tok_type = _PUNCT_TYPES[val]
+    elif tok_type == _VAR:
+        tok_type = _DIRECTIVE_TYPES.get(val[2:-2], _VAR)
+    elif tok_type == _ERROR:
+        raise ParserError
+    if tok_type in _INTERNED:
+        val = sys.intern(val)
+    return Token(tok_type, val)
+
+
+# Nodes of the tree built from the tokens of a template
+class TextNode(NamedTuple):
+    text: str
+
+
+class VarNode(NamedTuple):
+    key: str
+    name: str
+    idx: Union[None, int, str]
+
+
+class ForNode(NamedTuple):
+    range_nodes: List["Node"]
+    body_nodes: List["Node"]
+
+
+class IfNode(NamedTuple):
+    negate: bool
+    cond: List[Token]
+    const: Optional[bool]
+    then_nodes: List["Node"]
+    else_nodes: List["Node"]
+
+
+class DefineNode(NamedTuple):
+    key: Any
+    val: Any
+
+
+class UndefNode(NamedTuple):
+    key: str
+
+
+class ErrorNode(NamedTuple):
+    error_type: "Type[Exception]"
+    error_args: tuple
+
+
+Node = Union[TextNode, VarNode, ForNode, IfNode, DefineNode, UndefNode, ErrorNode]
+
+
+# Blocks of a template, indexed by the position of their opening token
+Blocks = Dict[int, Tuple[Optional[int], int, int]]
+# Position where the building resumes and the node built, if any
+Built = Tuple[int, Optional[Node]]
+
+
+def _match_blocks(tokens: List[Token]) -> Blocks:
+    """Match every block of a template with its ELSE and END in a single pass.
+
+    For every ..for::, ..if:: and ..ifnot:: the table holds the position of
+    its ELSE, if any, the position of its END and the position where the
+    parsing resumes after the block. Tokens in the rest of the line of a
+    comment, ..define:: or ..undef:: are ignored.
+
+    When a block is nested in another one, the token following its END,
+    usually the newline, is dropped.
+
+    Args:
+        tokens: List of tokens of the template.
+
+    Returns:
+        Table of blocks.
+    """
+    blocks: Blocks = {}
+    # Positions of the open blocks and of the ELSE of each of them
+    stack: List[int] = []
+    elses: Dict[int, int] = {}
+    skip_line = False
+    # Only a few tokens delimit blocks, so they are picked in a single sweep
+    marks = [(i, t.type) for i, t in enumerate(tokens) if t.type in _BLOCK_TYPES]
+    for idx, tok_type in marks:
+        if skip_line:
+            skip_line = tok_type != _NEWLINE
+        elif tok_type in _LINE_DIRECTIVES:
+            skip_line = True
+        elif tok_type in _OPENERS:
+            stack.append(idx)
+        elif tok_type == _ELSE:
+            if stack and tokens[stack[-1]].type != _FOR and stack[-1] not in elses:
+                elses[stack[-1]] = idx
+        elif tok_type == _END and stack:
+            open_idx = stack.pop()
+            blocks[open_idx] = (elses.get(open_idx, None), idx, idx + 1 + bool(stack))
+    return blocks
+
+
+def _find(tokens: List[Token], pos: int, end: int, tok_type: TokenType) -> int:
+    """Find the first token of a type in a range of tokens.
+
+    Args:
+        tokens: List of tokens.
+        pos: Index of the first token to look at.
+        end: Index past the last token to look at.
+        tok_type: Type of the token to find.
+
+    Raises:
+        IndexError: There is no token of the type in the range.
+
+    Returns:
+        Index of the token.
+    """
+    while pos < end:
+        if tokens[pos].type == tok_type:
+            return pos
+        pos += 1
+    raise IndexError(f"no {tok_type.name} token found")
+
+
+def _line_end(tokens: List[Token], pos: int, end: int) -> int:
+    """Find the end of the line of a token.
+
+    Args:
+        tokens: List of tokens.
+        pos: Index of the first token to look at.
+        end: Index past the last token to look at.
+
+    Returns:
+        Index of the next newline or end if it is the last line.
+    """
+    while pos < end and tokens[pos].type != _NEWLINE:
+        pos += 1
+    return pos
+
+
+def _find_block(blocks: Blocks, pos: int, end: int) -> Tuple[Optional[int], int, int]:
+    """Find the block opened at a position.
+
+    Args:
+        blocks: Table of blocks.
+        pos: Index of the token opening the block.
+        end: Index past the last token where the block can end.
+
+    Raises:
+        IndexError: The block is not closed before end.
+
+    Returns:
+        Position of the ELSE, position of the END and position after the block.
+    """
+    block = blocks.get(pos, None)
+    if block is None or block[1] >= end:
+        raise IndexError("no END token found")
+    return block
+
+
+def _build_comment(tokens: List[Token], pos: int, end: int, blocks: Blocks) -> Built:
+    """Skip a comment until the end of its line.
+
+    Args:
+        tokens: List of tokens of the template.
+        pos: Index of the comment token.
+        end: Index past the last token that can be built.
+        blocks: Table of blocks of tokens.
+
+    Returns:
+        Position after the comment and no node.
+    """
+    return _line_end(tokens, pos + 1, end), None
+
+
+def _build_for(tokens: List[Token], pos: int, end: int, blocks: Blocks) -> Built:
+    """Build a ..for:: loop from its range and its body.
+
+    Args:
+        tokens: List of tokens of the template.
+        pos: Index of the ..for:: token.
+        end: Index past the last token that can be built.
+        blocks: Table of blocks of tokens.
+
+    Raises:
+        IndexError: The loop is not closed or has no range.
+
+    Returns:
+        Position after the block and the ForNode.
+    """
+    _, end_idx, resume = _find_block(blocks, pos, end)
+    range_start = pos + 2
+    range_end = _find(tokens, range_start, end_idx, _NEWLINE)
+    range_nodes = _build_ast(tokens, range_start, range_end, blocks)
+    body_nodes = _build_ast(tokens, range_end + 1, end_idx, blocks)
+    return resume, ForNode(range_nodes, body_nodes)
+
+
+def _cond_const(cond: List[Token]) -> Optional[bool]:
+    """Obtain the result of a conditional that does not depend on the env.
+
+    Args:
+        cond: List of tokens of the conditional.
+
+    Returns:
+        Result of the conditional or None if it has to be evaluated.
+    """
+    first = next((t for t in cond if t.type != _SPACE), None)
+    if first is None or first.type == _IDENTIFIER:
+        return None
+    return bool(token_value(first))
+
+
+def _build_if(tokens: List[Token], pos: int, end: int, blocks: Blocks) -> Built:
+    """Build a ..if:: or ..ifnot:: conditional and its branches.
+
+    Args:
+        tokens: List of tokens of the template.
+        pos: Index of the conditional token.
+        end: Index past the last token that can be built.
+        blocks: Table of blocks of tokens.
+
+    Raises:
+        IndexError: The conditional is not closed or has no newline.
+
+    Returns:
+        Position after the block and the IfNode.
+    """
+    negate = tokens[pos].type == _IFNOT
+    else_idx, end_idx, resume = _find_block(blocks, pos, end)
+    cond_end = _find(tokens, pos + 1, end_idx, _NEWLINE)
+    cond = tokens[pos + 1 : cond_end]
+
+    if else_idx is None:
+        then_nodes = _build_ast(tokens, cond_end + 1, end_idx, blocks)
+        else_nodes = []
+    else:
+        then_nodes = _build_ast(tokens, cond_end + 1, else_idx, blocks)
+        else_nodes = _build_ast(tokens, else_idx + 1, end_idx, blocks)
+    node = IfNode(negate, cond, _cond_const(cond), then_nodes, else_nodes)
+    return resume, node
+
+
+def _build_define(tokens: List[Token], pos: int, end: int, blocks: Blocks) -> Built:
+    """Build a ..define:: from the key and the value on its line.
+
+    Args:
+        tokens: List of tokens of the template.
+        pos: Index of the ..define:: token.
+        end: Index past the last token that can be built.
+        blocks: Table of blocks of tokens.
+
+    Returns:
+        Position after the line and the DefineNode.
+    """
+    line_end = _line_end(tokens, pos + 1, end)
+    # The key and the value are the first two tokens of the line
+    values: List[Any] = [
+        token_value(t) for t in tokens[pos + 1 : line_end] if t.type != _SPACE
+    ]
+    values += [None, None]
+    return line_end + 1, DefineNode(values[0], values[1])
+
+
+def _build_undef(tokens: List[Token], pos: int, end: int, blocks: Blocks) -> Built:
+    """Build a ..undef:: from the key on its line.
+
+    Args:
+        tokens: List of tokens of the template.
+        pos: Index of the ..undef:: token.
+        end: Index past the last token that can be built.
+        blocks: Table of blocks of tokens.
+
+    Raises:
+        IndexError: There is no key to undefine.
+
+    Returns:
+        Position after the line and the UndefNode.
+    """
+    key_pos = _find(tokens, pos, end, _IDENTIFIER)
+    return _line_end(tokens, key_pos, end) + 1, UndefNode(tokens[key_pos].val)
+
+
+def _build_var(tokens: List[Token], pos: int, end: int, blocks: Blocks) -> Built:
+    """Build a variable, with its index if it is followed by one.
+
+    Args:
+        tokens: List of tokens of the template.
+        pos: Index of the variable token.
+        end: Index past the last token that can be built.
+        blocks: Table of blocks of tokens.
+
+    Returns:
+        Position after the variable and the VarNode.
+    """
+    key = tokens[pos].val
+    # Name of the variable without the ..name:: wrapper
+    name = sys.intern(key[2:-2])
+    if (
+        pos + 3 < end
+        and tokens[pos + 1].type == _LB
+        and tokens[pos + 3].type == _RB
+    ):
+        # The index should be a number, converted once here, or ..it::
+        idx_token = tokens[pos + 2]
+        idx: Union[int, str] = idx_token.val
+        if idx_token.type == _NUMBER:
+            idx = int(idx)
+        return pos + 4, VarNode(key, name, idx)
+    return pos + 1, VarNode(key, name, None)
+
+
+# Builders of the tree, indexed by the type of the current token
+_BUILDERS: Dict[TokenType, Callable[[List[Token], int, int, Blocks], Built]] = {
+    TokenType.COMMENT: _build_comment,
+    TokenType.FOR: _build_for,
+    TokenType.IF: _build_if,
+    TokenType.IFNOT: _build_if,
+    TokenType.DEFINE: _build_define,
+    TokenType.UNDEF: _build_undef,
+    TokenType.VAR: _build_var,
+}
+
+
+def _build_ast(
+    tokens: List[Token],
+    start: int = 0,
+    end: Optional[int] = None,
+    blocks: Optional[Blocks] = None,
+) -> List[Node]:
+    """Build the tree of nodes of a template from its tokens.
+
+    Blocks are delimited once, so that loops and conditionals evaluate
+    their prebuilt bodies. Consecutive text is merged into a single node.
+    A malformed block becomes an ErrorNode, which raises the error only
+    when the block is evaluated.
+
+    Blocks are built from index ranges of the same list of tokens, so no
+    token is copied, and are delimited with the table from _match_blocks.
+
+    Args:
+        tokens: List of tokens of the template.
+        start: Index of the first token to build.
+        end: Index past the last token to build, by default the end of tokens.
+        blocks: Table of blocks of tokens, computed if not given.
+
+    Returns:
+        List of nodes of the template.
+    """
+    nodes: List[Node] = []
+    text: List[str] = []
+    end = len(tokens) if end is None else end
+    blocks = _match_blocks(tokens) if blocks is None else blocks
+    pos = start
+    prev_type: Optional[TokenType] = None
+    while pos < end:
+        builder = _BUILDERS.get(tokens[pos].type, None)
+        if builder is None:
+            # Copy the whole run of text, dropping whitespace after a newline.
+            # The first token is compared with the last one, as if the range
+            # was indexed on its own.
+            if prev_type is None:
+                prev_type = tokens[pos - 1 if pos > start else end - 1].type
+            while pos < end:
+                token = tokens[pos]
+                tok_type = token.type
+                if tok_type in _BUILDERS:
+                    break
+                if tok_type not in _BLANKS or prev_type != _NEWLINE:
+                    text.append(token.val)
+                prev_type = tok_type
+                pos += 1
+            continue
+
+        try:
+            pos, node = builder(tokens, pos, end, blocks)
+        except IndexError as e:
+            node, pos = ErrorNode(type(e), e.args), end
+        # Text after a block follows its END, even if the token dropped
+        # after the END of a nested block is a newline
+        prev_type = _END if isinstance(node, (ForNode, IfNode)) else None
+        if node is None:
+            continue
+        if text:
+            nodes.append(TextNode("".join(text)))
+            text = []
+        nodes.append(node)
+
+    if text:
+        nodes.append(TextNode("".join(text)))
+    return nodes
+
+
+def _is_plain(buf: str) -> bool:
+    """Check whether a template evaluates to itself.
+
+    It is the case when the template has no directives, variables or
+    comments and no whitespace is dropped after a newline.
+
+    Args:
+        buf: Text of the template.
+
+    Returns:
+        True if the template can be output as it is.
+    """
+    if not _PLAIN_RE.fullmatch(buf) or _INDENT_RE.search(buf):
+        return False
+    # Leading whitespace is dropped when the template ends with a newline
+    return not (buf[:1].isspace() and buf[-1:] in ("\r", "\n"))
+
+
+@functools.lru_cache(maxsize=128)
+def _compile(text: str) -> List[Node]:
+    """Build the tree of nodes of a template file.
+
+    The tree is cached by the text of the file, so a file is only
+    tokenized again when its contents change, and files with the same
+    contents share their tree.
+
+    Args:
+        text: Contents of the file.
+
+    Raises:
+        ParserError: Error during parsing.
+
+    Returns:
+        List of nodes of the template.
+    """
+    if _is_plain(text):
+        return [TextNode(text)]
+    return _build_ast(Parser(text).tokenize())
+
+
 class Parser:
     """Parser class to provide template substitution.
 
     Attributes:
         buf: Buffer containing the template.
+        path: Resolved path of the file containing the template, if any.
         pos: Position in the buffer.
-        group_type:
         env: Dictionary containing values for the substitutions
     """
 
-    def __init__(self, buf: Union[str, Path], env: dict = None):
+    def __init__(self, buf: Union[str, Path], env: Optional[dict] = None):
         """Create a parser.
 
         Args:
             buf: Text to be parsed or pointer to file.
             env: Dictionary containing values for substitutions.
         """
+        self.path: Optional[Path] = None
         if isinstance(buf, Path):
-            self.buf = buf.read_text()
+            self.path = buf.resolve()
+            self.buf = self.path.read_text()
         else:
             self.buf = buf
         self.pos = 0
 
-        rules = [
-            (r"[\r\n]+", "NEWLINE"),
-            (r"\s+", "SPACE"),
-            (r"#+", "COMMENT"),
-            ("\d+", "NUMBER"),
-            ("[Tt]rue", "TRUE"),
-            ("[Ff]alse", "FALSE"),
-            ("=", "EQUAL"),
-            ("\+", "PLUS"),
-            ("\-", "MINUS"),
-            ("\*", "MULT"),
-            ("\(", "LP"),
-            ("\)", "RP"),
-            ("\[", "LB"),
-            ("\]", "RB"),
-            (r"..define::", "DEFINE"),
-            (r"..for::", "FOR"),
-            (r"..undef::", "UNDEF"),
-            (r"..if::", "IF"),
-            (r"..ifnot::", "IFNOT"),
-            (r"..else::", "ELSE"),
-            (r"..end::", "END"),
-            (r"..\w+::", "VAR"),
-            ("[a-zA-Z_0-9]+", "IDENTIFIER"),
-        ]
-        idx = 1
-        regex_parts = []
-        self.group_type = {}
         self.env = {} if env is None else env.copy()
 
-        for regex, type in rules:
-            groupname = f"GROUP{idx}"
-            regex_parts.append(f"(?P<{groupname}>{regex})")
-            self.group_type[groupname] = type
-            idx += 1
-
-        self.regex = re.compile("|".join(regex_parts))
+        # Handlers of the evaluation, indexed by the type of the node
+        self._handlers: Dict[type, Callable[[Any, Optional[int]], str]] = {
+            TextNode: self.__eval_text,
+            VarNode: self.__eval_var,
+            ForNode: self.__eval_for,
+            IfNode: self.__eval_if,
+            DefineNode: self.__eval_define,
+            UndefNode: self.__eval_undef,
+            ErrorNode: self.__eval_error,
+        }
 
     def get_token(self) -> Optional[Token]:
         """Get a token from the buffer.
@@ -122,30 +658,26 @@ class Parser:
         """
         if self.pos >= len(self.buf):
             return None
-        else:
-            m = self.regex.match(self.buf, self.pos)
-            if m:
-                groupname = m.lastgroup
-                tok_type = self.group_type[groupname]
-                tok = Token(tok_type, m.group(groupname))
-                self.pos = m.end()
-                return tok
 
+        m = _REGEX.match(self.buf, self.pos)
+        if m is None:
             raise ParserError
+        self.pos = m.end()
+        return _match_token(m)
 
     def tokenize(self) -> List[Token]:
         """Obtain all tokens from the buffer.
 
+        The whole buffer is tokenized in a single pass of the regex.
+
         Returns:
             List of all tokens
+
+        Raises:
+            ParserError: Error during parsing.
         """
-        tokens = []
-        self.pos = 0
-        while True:
-            tok = self.get_token()
-            if tok is None:
-                break
-            tokens.append(tok)
+        tokens = [_match_token(m) for m in _REGEX.finditer(self.buf)]
+        self.pos = len(self.buf)
         return tokens
 
     def __handle_cond(self, tokens: List[Token]) -> bool:
@@ -154,173 +686,178 @@ class Parser:
         Args:
             tokens: List of tokens to obtain a boolean from
         """
-        tokens = list(filter(lambda t: t.type != "SPACE", tokens))
-        if tokens[0].type in ["TRUE", "FALSE"]:
-            return tokens[0].value()
-        if tokens[0].type == "IDENTIFIER":
-            return bool(self.env.get(tokens[0].value(), None))
+        first = next((t for t in tokens if t.type != _SPACE), None)
+        if first is None:
+            raise IndexError("conditional without a value")
+        if first.type in (_TRUE, _FALSE):
+            return bool(token_value(first))
+        if first.type == _IDENTIFIER:
+            return bool(self.env.get(token_value(first), None))
         else:
-            return bool(tokens[0].value())
+            return bool(token_value(first))
 
-    def parse(self, tokens=None, iter_id=None) -> Optional[str]:
-        """Parse tokens and execute the subsitution.
+    def __eval_nodes(self, nodes: List[Node], iter_id: Optional[int]) -> str:
+        """Evaluate a list of nodes and join their results.
 
         Args:
-            tokens: List of tokens to parse
-            iter_id: If evaluating a loop, the iteration fo the loop.
+            nodes: Nodes to evaluate.
+            iter_id: If evaluating a loop, the iteration of the loop.
 
         Returns:
-            A string if the substitutions is executed or an empty string.
+            Result of evaluating the nodes.
         """
-        tokens = tokens if tokens is not None else self.tokenize()
-        result = ""
-        pos = 0
-        while pos < len(tokens):
-            token = tokens[pos]
-            if token.type == "COMMENT":
-                pos += 1
-                while tokens[pos].type != "NEWLINE":
-                    pos += 1
-
-            elif token.type in ["SPACE", "NEWLINE"]:
-                if tokens[pos - 1].type == "NEWLINE":
-                    pos += 1
-                    continue
-                else:
-                    result += token.val
-                    pos += 1
-
-            elif token.type == "FOR":
-                pos += 2
-                range_loop = []
-                while tokens[pos].type != "NEWLINE":
-                    range_loop.append(tokens[pos])
-                    pos += 1
-
-                start, end = self.parse(range_loop).split(" ")
-                pos += 1
-                body = []
+        handlers = self._handlers
+        return "".join([handlers[type(node)](node, iter_id) for node in nodes])
 
-                while tokens[pos].type != "END":
-                    body.append(tokens[pos])
-                    pos += 1
+    def __eval_text(self, node: TextNode, iter_id: Optional[int]) -> str:
+        """Evaluate a node of text, which is output as it is.
 
-                for i in range(int(start), int(end)):
-                    result += self.parse(body, iter_id=i)
-                pos += 1
+        Args:
+            node: Node of text.
+            iter_id: If evaluating a loop, the iteration of the loop.
 
-            elif token.type in ["IF", "IFNOT"]:
-                cond_type = token.type
-                cond = []
-                pos += 1
+        Returns:
+            Text of the node.
+        """
+        return node.text
 
-                while tokens[pos].type != "NEWLINE":
-                    cond.append(tokens[pos])
-                    pos += 1
+    def __eval_var(self, node: VarNode, iter_id: Optional[int]) -> str:
+        """Evaluate a variable, indexing it if needed.
 
-                pos += 1
-                body = [[], []]
-                branch_sel = 0
-                level = 1
-
-                while True:
-                    if tokens[pos].type == "IF":
-                        level += 1
-                        body[branch_sel].append(tokens[pos])
-                    elif tokens[pos].type == "ELSE":
-                        if level == 1:
-                            branch_sel = 1
-                        else:
-                            body[branch_sel].append(tokens[pos])
-                    elif tokens[pos].type == "END":
-                        if level <= 1:
-                            break
-                        else:
-                            level -= 1
-                            body[branch_sel].append(tokens[pos])
-                            pos += 1
-                    else:
-                        body[branch_sel].append(tokens[pos])
-                    pos += 1
-
-                if cond_type == "IF":
-                    cond_res = self.__handle_cond(cond)
-                if cond_type == "IFNOT":
-                    cond_res = not self.__handle_cond(cond)
-
-                if cond_res:
-                    res = self.parse(tokens=body[0])
-                else:
-                    res = self.parse(tokens=body[1])
-                if res:
-                    result += res
-                pos += 1
+        Args:
+            node: Node of the variable.
+            iter_id: If evaluating a loop, the iteration of the loop.
 
-            elif token.type == "DEFINE":
-                key, val = None, None
-                pos += 1
-                while True:
-                    if tokens[pos].type == "SPACE":
-                        pos += 1
-                    else:
-                        if key is None:
-                            key = tokens[pos].value()
-                        elif val is None and key is not None:
-                            val = tokens[pos].value()
-                        else:
-                            break
-                        pos += 1
-                self.env[key] = val
-                pos += 2
-
-            elif token.type == "UNDEF":
-                key = None
-                while True:
-                    if tokens[pos].type == "IDENTIFIER":
-                        key = tokens[pos].val
-                        break
-                    pos += 1
-                del self.env[key]
-                while tokens[pos].type != "NEWLINE":
-                    pos += 1
-                pos += 1
+        Returns:
+            Value of the variable, or its key if it is not defined.
+        """
+        key, idx = node.key, node.idx
+        if idx is None:
+            if key == "..it::" and iter_id is not None:
+                return str(iter_id)
+            return str(self.env.get(node.name, key))
+        if type(idx) is not int:
+            if idx != "..it::":
+                idx = int(idx)
+            elif iter_id is None:
+                return idx
+            elif key == "..it::":
+                # The iteration is not indexed, as ..it:: alone
+                return str(iter_id)
+            else:
+                idx = iter_id
+        return str(self.env.get(node.name, key)[idx])
 
-            elif token.type == "VAR":
-                key = tokens[pos].val
-                if (
-                    len(tokens) > 3
-                    and tokens[pos + 1].type == "LB"
-                    and tokens[pos + 3].type == "RB"
-                ):
-                    pos += 1
-                    idx = tokens[pos + 1].val  # Should be a number or ..it::
-                    if idx == "..it::" and iter_id is None:
-                        result += str(idx)
-                    elif idx == "..it::" and iter_id is not None:
-                        result += str(iter_id)
-                    else:
-                        result += str(self.env.get(key[2:-2], key)[int(idx)])
-
-                    pos += 3
-                else:
-                    if key == "..it::" and iter_id is None:
-                        result += str(idx)
-                    elif key == "..it::" and iter_id is not None:
-                        result += str(iter_id)
-                    else:
-                        result += str(self.env.get(key[2:-2], key))
-
-                    pos += 1
+    def __eval_for(self, node: ForNode, iter_id: Optional[int]) -> str:
+        """Evaluate the body of a loop once per iteration of its range.
 
-            else:
-                result += token.val
-                pos += 1
-        return result
+        Args:
+            node: Node of the loop.
+            iter_id: If evaluating a loop, the iteration of the loop.
+
+        Returns:
+            Result of all the iterations.
+        """
+        start, end = self.__eval_nodes(node.range_nodes, None).split(" ")
+        body = node.body_nodes
+        result = [self.__eval_nodes(body, i) for i in range(int(start), int(end))]
+        return "".join(result)
+
+    def __eval_if(self, node: IfNode, iter_id: Optional[int]) -> str:
+        """Evaluate the branch of a conditional that is taken.
+
+        Args:
+            node: Node of the conditional.
+            iter_id: If evaluating a loop, the iteration of the loop.
+
+        Returns:
+            Result of the branch.
+        """
+        cond_res = node.const
+        if cond_res is None:
+            cond_res = self.__handle_cond(node.cond)
+        if node.negate:
+            cond_res = not cond_res
+        branch = node.then_nodes if cond_res else node.else_nodes
+        return self.__eval_nodes(branch, iter_id)
+
+    def __eval_define(self, node: DefineNode, iter_id: Optional[int]) -> str:
+        """Define a variable in the env.
+
+        Args:
+            node: Node of the definition.
+            iter_id: If evaluating a loop, the iteration of the loop.
+
+        Returns:
+            An empty string.
+        """
+        self.env[node.key] = node.val
+        return ""
+
+    def __eval_undef(self, node: UndefNode, iter_id: Optional[int]) -> str:
+        """Remove a variable from the env.
+
+        Args:
+            node: Node of the variable to remove.
+            iter_id: If evaluating a loop, the iteration of the loop.
+
+        Returns:
+            An empty string.
+        """
+        del self.env[node.key]
+        return ""
+
+    def __eval_error(self, node: ErrorNode, iter_id: Optional[int]) -> str:
+        """Raise the error of a malformed block.
+
+        A new exception is raised on every evaluation, so that the tracebacks
+        of previous evaluations of a cached tree are not kept alive.
+
+        Args:
+            node: Node of the error.
+            iter_id: If evaluating a loop, the iteration of the loop.
+
+        Raises:
+            IndexError: The error found when building the block.
+        """
+        raise node.error_type(*node.error_args)
+
+    def parse(
+        self,
+        tokens: Optional[List[Token]] = None,
+        iter_id: Optional[int] = None,
+        start: int = 0,
+        end: Optional[int] = None,
+    ) -> str:
+        """Parse tokens and execute the subsitution.
+
+        The tokens are first built into a tree of nodes, which is then
+        evaluated against the environment.
+
+        Args:
+            tokens: List of tokens to parse
+            iter_id: If evaluating a loop, the iteration fo the loop.
+            start: Index of the first token to parse.
+            end: Index past the last token to parse, by default all the tokens.
+
+        Returns:
+            A string if the substitutions is executed or an empty string.
+        """
+        tokens = tokens if tokens is not None else self.tokenize()
+        return self.__eval_nodes(_build_ast(tokens, start, end), iter_id)
 
     def eval(self) -> str:
         """Evaluate a template.
 
+        The tree of a template file is cached across parsers, so evaluating
+        it again with another env does not tokenize it.
+
         Returns:
             Result of evaluating the template.
         """
+        if self.path is not None:
+            return self.__eval_nodes(_compile(self.buf), None)
+        # Templates without directives skip the tokenization
+        if _is_plain(self.buf):
+            return self.buf
         return self.parse(self.tokenize())
@@ -1,13 +1,38 @@
 #!/usr/bin/env python3
 
+import os
 import pathlib
 
-from setuptools import find_packages, setup
+from setuptools import Extension, find_packages, setup
+
+try:
+    from Cython.Build import cythonize
+except ImportError:
+    cythonize = None
 
 HERE = pathlib.Path(__file__).parent
 
 README = (HERE / "README.md").read_text()
 
+# The template parser is compiled with mypyc when MONACO_MYPYC is set,
+# or with Cython when it is available.
+# Otherwise the pure python module is installed.
+if os.environ.get("MONACO_MYPYC"):
+    from mypyc.build import mypycify
+
+    # The module is compiled on its own, so it can also be imported as a
+    # top level module with monaco/ in the path, and it is placed in monaco/
+    EXT_MODULES = mypycify(["monaco/parser.py"])
+    for ext in EXT_MODULES:
+        ext.name = f"monaco.{ext.name}"
+elif cythonize is not None:
+    EXT_MODULES = cythonize(
+        [Extension("monaco.parser", ["monaco/parser.py"])],
+        compiler_directives={"language_level": "3"},
+    )
+else:
+    EXT_MODULES = []
+
 setup(
     name="monaco",
     version="0.1.0",
@@ -25,6 +50,7 @@ setup(
     ],
     packages=find_packages(),
     include_package_data=True,
+    ext_modules=EXT_MODULES,
     entry_points={
         "console_scripts": [
             "monaco=monaco.monaco:main",
@@ -0,0 +1,163 @@
+import random
+from pathlib import Path
+
+import pytest
+
+from monaco.monaco import (
+    SimBuilder,
+    SimulatorTimeout,
+    params_is_batchable,
+    params_parse,
+)
+
+
+@pytest.fixture
+def project(tmp_path: Path) -> Path:
+    path = tmp_path / "proj"
+    (path / "results").mkdir(parents=True)
+    (path / "proj.netlist").write_text("v=$v\n")
+    return path
+
+
+def test_params_parse_returns_copies():
+    definition = "v{1:2} uniform 0 1\nt list 1 2"
+    parsed = params_parse(definition)
+    parsed["v1"]["values"].append(99)
+    assert params_parse(definition)["v1"]["values"] == [0, 1]
+    assert parsed["v2"]["values"] == [0, 1]
+
+
+def test_params_parse_streams_files(tmp_path: Path):
+    path = tmp_path / "p.params"
+    path.write_text("# comment\n\na list 1\n")
+    assert params_parse(path) == {"a": {"function": "list", "values": [1]}}
+    path.write_text("a list 1 2\n")
+    assert params_parse(path) == {"a": {"function": "list", "values": [1, 2]}}
+
+
+def test_result_cache_keeps_shared_files(project: Path):
+    results = project / "results"
+    sim = SimBuilder(project)
+    sim.with_props({"v": 1})
+    sim.with_simulator(
+        "sh -c 'echo x >> ${results}/count.txt; echo out > ${results}/out.txt'"
+    )
+    sim.with_result_cache(outputs=["out.txt"])
+
+    sim.run_single()
+    (results / "out.txt").write_text("other")
+    sim.run_single()
+
+    assert (results / "out.txt").read_text() == "out\n"
+    assert (results / "count.txt").read_text() == "x\n"
+
+
+def test_output_written_after_parallel_run(project: Path):
+    (project / "aux.txt").write_text("v=$v\n")
+    sim = SimBuilder(project)
+    sim.with_simulator("true")
+    sim.with_files({str(project / "aux.txt"): str(project / "aux_${iteration}.txt")})
+
+    sim.with_props({"v": 1})
+    sim.run_single(1)
+    sim.with_props({"v": 2})
+    list(sim.run_iterations_parallel(1, workers=1))
+    sim.with_props({"v": 1})
+    sim.run_single(1)
+
+    assert (project / "aux_1.txt").read_text() == "v=1\n"
+
+
+def test_output_paths_are_substituted(project: Path):
+    (project / "aux.txt").write_text("v=$iteration\n")
+    sim = SimBuilder(project)
+    sim.with_simulator("true")
+    sim.with_files({str(project / "aux.txt"): str(project / "aux_${iteration}.txt")})
+
+    list(sim.run_iterations(2))
+
+    assert (project / "aux_2.txt").read_text() == "v=2\n"
+    assert not (project / "aux_${iteration}.txt").exists()
+
+
+def test_parallel_outputs_need_a_per_run_variable(project: Path):
+    (project / "aux.txt").write_text("v=$v\n")
+    sim = SimBuilder(project)
+    sim.with_simulator("true")
+    sim.with_files({str(project / "aux.txt"): "${project}/m.inc"})
+
+    with pytest.raises(ValueError):
+        list(sim.run_iterations_parallel(2))
+
+
+def test_parallel_netlists_are_removed(project: Path):
+    sim = SimBuilder(project)
+    sim.with_props({"v": 1})
+    sim.with_simulator("true")
+
+    assert len(list(sim.run_iterations_parallel(3, workers=2))) == 3
+    assert not list(project.glob("proj_net_out_*"))
+
+
+def test_run_iterations_matches_run_single(project: Path):
+    def run(iterate: bool):
+        sim = SimBuilder(project)
+        sim.with_simulator("true")
+        sim.with_parametric("v uniform 0 1\nw uniform 0 1")
+        random.seed(0)
+        if iterate:
+            return [p for p, _ in sim.run_iterations(2)]
+        return [sim.run_single(i)[0] for i in (1, 2)]
+
+    assert run(True) == run(False)
+
+
+def test_run_iterations_stops_with_sweeps(project: Path):
+    calls = []
+    sim = SimBuilder(project)
+    sim.with_simulator("true")
+    sim.with_custom_fns({"f": lambda: calls.append(1) or 1})
+    sim.with_parametric("v f")
+    sim.with_sweeps("t list 1 2 3")
+
+    assert len(list(sim.run_iterations(1000))) == 3
+    assert len(calls) == 3
+
+
+def test_numpy_functions_without_size():
+    np = pytest.importorskip("numpy")
+    assert not params_is_batchable(np.random.rand, ())
+    assert not params_is_batchable(np.random.randint, (0, 10, 1))
+    assert params_is_batchable(np.random.randint, (0, 10))
+
+
+def test_parameters_stream_is_overwritten(project: Path):
+    path = project / "params.jsonl"
+    sim = SimBuilder(project)
+    sim.with_simulator("true")
+    sim.with_parametric("v uniform 0 1")
+
+    for _ in range(2):
+        sim.save_parameters_stream(path)
+        list(sim.run_iterations(2))
+        sim.save_parameters_stream(None)
+    assert len(path.read_text().splitlines()) == 2
+
+    sim.save_parameters_stream(path, append=True)
+    list(sim.run_iterations(2))
+    sim.save_parameters_stream(None)
+    assert len(path.read_text().splitlines()) == 4
+
+
+def test_persistent_simulator_times_out(project: Path):
+    sim = SimBuilder(project)
+    sim.with_props({"v": 1})
+    with sim:
+        sim.with_simulator("echo run ${iteration}; echo DONE_${iteration}")
+        sim.with_persistent_simulator("sh", done_token="DONE_${iteration}")
+        assert len(list(sim.run_iterations(2))) == 2
+
+        sim.with_simulator("echo partial; sleep 5")
+        sim.with_persistent_simulator("sh", done_token="DONE", timeout=0.2)
+        with pytest.raises(SimulatorTimeout, match="partial"):
+            sim.run_single()
@@ -0,0 +1,66 @@
+from pathlib import Path
+
+import pytest
+
+from monaco import parser
+from monaco.parser import Parser, ParserError
+
+
+def test_define_consumes_its_line():
+    tmpl = "..define:: a 1\n..define:: b 2\n..a:: ..b::\n"
+    assert Parser(tmpl).eval() == "1 2\n"
+
+
+def test_stray_directive_suffix_raises():
+    with pytest.raises(ParserError):
+        Parser("a xxfor:: b\n").eval()
+
+
+def test_indexed_variables():
+    env = {"x": [5, 6, 7]}
+    assert Parser("..x::[1] ..x::[0]\n", env).eval() == "6 5\n"
+    assert Parser("..for:: 0 3\n..x::[..it::]\n..end::\n", env).eval() == "5\n6\n7\n\n"
+
+
+def test_iteration_indexed_by_iteration():
+    tmpl = "..for:: 0 3\n..it::[..it::]\n..end::\n"
+    assert Parser(tmpl).eval() == "0\n1\n2\n\n"
+    assert Parser("..it::[..it::]\n").eval() == "..it::\n"
+
+
+def test_nested_conditional_keeps_indentation():
+    tmpl = "..if:: a\n..if:: a\nx\n..end::\n  y\n..end::\nz\n"
+    assert Parser(tmpl, {"a": 1}).eval() == "x\n  y\n\nz\n"
+
+
+def test_loop_nested_in_conditional():
+    tmpl = "..if:: a\n..for:: 0 2\n..it::\n..end::\n..end::\n"
+    assert Parser(tmpl, {"a": 1}).eval() == "0\n1\n\n"
+
+
+def test_commented_end_does_not_close_block():
+    tmpl = "..if:: a\n# ..end::\nx\n..end::\ny\n"
+    assert Parser(tmpl, {"a": 0}).eval() == "\ny\n"
+
+
+def test_unterminated_block_raises_on_eval():
+    with pytest.raises(IndexError):
+        Parser("..if:: a\nx\n", {"a": 1}).eval()
+
+
+def test_files_with_same_text_share_tree(tmp_path: Path):
+    first, second = tmp_path / "a.net", tmp_path / "b.net"
+    first.write_text("x=..x::\n")
+    second.write_text("x=..x::\n")
+    parser._compile.cache_clear()
+    assert Parser(first, {"x": 1}).eval() == "x=1\n"
+    assert Parser(second, {"x": 2}).eval() == "x=2\n"
+    assert parser._compile.cache_info().hits == 1
+
+
+def test_file_is_parsed_again_when_text_changes(tmp_path: Path):
+    path = tmp_path / "t.net"
+    path.write_text("a=..x::\n")
+    assert Parser(path, {"x": 1}).eval() == "a=1\n"
+    path.write_text("b=..x::\n")
+    assert Parser(path, {"x": 1}).eval() == "b=1\n"